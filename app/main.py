@@ -9,13 +9,23 @@ Expected CSV columns: transaction_id, user_id, product_id, timestamp, transactio
 """
 
 from fastapi import FastAPI, UploadFile, File, HTTPException, Query
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import Optional
-from datetime import datetime, date, timedelta
+from datetime import date
+import anyio
+import asyncio
+import csv
 import duckdb
+import io
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import os
-import tempfile
+import queue
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from concurrent.futures import Future
 
 
 
@@ -26,32 +36,496 @@ import tempfile
 DB_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "transactions.duckdb")
 os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 
+# types the uploaded CSV columns are parsed into, these match the transactions table
+CSV_COLUMN_TYPES = {
+    "transaction_id": pa.string(),
+    "user_id": pa.int32(),
+    "product_id": pa.int32(),
+    "timestamp": pa.timestamp("us"),
+    "transaction_amount": pa.float64(),
+}
+
+# size of the blocks the CSV reader parses in parallel
+CSV_BLOCK_SIZE = 8 << 20
+
+# per-user totals for a set of rows, used to build and update the user_summary rollup.
+# rows with an empty user_id are still stored in transactions (as they always were) but
+# can't belong to any user's summary, so they are left out of the rollup
+ROLLUP_SELECT = """
+    SELECT user_id,
+        COUNT(*),
+        COUNT(transaction_amount),
+        SUM(transaction_amount),
+        MIN(transaction_amount),
+        MAX(transaction_amount)
+    FROM {source}
+    WHERE user_id IS NOT NULL
+    GROUP BY user_id
+"""
+
+# upload statements, run against the uploaded rows registered as tmp_csv. the text is the
+# same for every upload so nothing is built per request.
+# insert rows into transactions table, columns already have the right types except
+# timestamp, which is text when the upload has zone offsets (a no-op cast otherwise).
+# rows are written in day then user order so each row group covers a narrow
+# timestamp range, which lets date filtered queries skip row groups by their min/max
+_INGEST_INSERT = """
+    INSERT INTO transactions (user_id, product_id, timestamp, transaction_amount, transaction_id)
+    SELECT user_id, product_id, timestamp, transaction_amount, transaction_id
+    FROM (SELECT * REPLACE (CAST(timestamp AS TIMESTAMP) AS timestamp) FROM tmp_csv)
+    ORDER BY CAST(timestamp AS DATE), user_id;
+"""
+_INGEST_MERGE_ROLLUP = f"""
+    INSERT INTO user_summary {ROLLUP_SELECT.format(source='tmp_csv')}
+    ON CONFLICT (user_id) DO UPDATE SET
+        tx_count = tx_count + excluded.tx_count,
+        amount_count = amount_count + excluded.amount_count,
+        amount_sum = COALESCE(amount_sum + excluded.amount_sum, amount_sum, excluded.amount_sum),
+        amount_min = LEAST(amount_min, excluded.amount_min),
+        amount_max = GREATEST(amount_max, excluded.amount_max);
+"""
+INGEST_SQL = f"BEGIN; {_INGEST_INSERT} {_INGEST_MERGE_ROLLUP} COMMIT;"
+
+# /summary queries keyed by (has start date, has end date), built once here so requests
+# don't assemble SQL. with no date filter the totals come straight from the user_summary rollup.
+# start/end are DATE params, end is inclusive so rows must be before midnight of the next day.
+# SUMMARY_QUERIES look up one user with user_id = ?, the only form DuckDB answers from
+# the user_id index / primary key. SUMMARY_BATCH_QUERIES answer a list of users (first
+# param) in one scan and return one row per user that has transactions
+_SUMMARY_AGGREGATE = """
+    SELECT {user_col}COUNT(*) AS count,
+        MIN(transaction_amount) AS min,
+        MAX(transaction_amount) AS max,
+        AVG(transaction_amount) AS mean
+    FROM transactions
+    WHERE {user_filter}{filters}{group_by};
+"""
+_SUMMARY_ROLLUP = """
+    SELECT {user_col}tx_count, amount_min, amount_max, amount_sum / amount_count
+    FROM user_summary
+    WHERE {user_filter};
+"""
+_START_FILTER = "timestamp >= CAST(? AS TIMESTAMP)"
+_END_FILTER = "timestamp < CAST(? AS DATE) + INTERVAL 1 DAY"
+_DATE_FILTERS = {
+    (True, False): f" AND {_START_FILTER}",
+    (False, True): f" AND {_END_FILTER}",
+    (True, True): f" AND {_START_FILTER} AND {_END_FILTER}",
+}
+
+def _summary_queries(user_col, user_filter, group_by):
+    queries = {(False, False): _SUMMARY_ROLLUP.format(user_col=user_col, user_filter=user_filter)}
+    for key, filters in _DATE_FILTERS.items():
+        queries[key] = _SUMMARY_AGGREGATE.format(
+            user_col=user_col, user_filter=user_filter, filters=filters, group_by=group_by
+        )
+    return queries
+
+SUMMARY_QUERIES = _summary_queries("", "user_id = ?", "")
+SUMMARY_BATCH_QUERIES = _summary_queries("user_id, ", "user_id IN (SELECT UNNEST(?))", " GROUP BY user_id")
+
+# groups of fewer users than this are looked up one user_id = ? query each, bigger ones
+# share one SUMMARY_BATCH_QUERIES scan. on the 1M row / 1000 user dummy data the batch
+# wins from 2 users, on a 3M row / 100k user table only from ~12, so this sits in between
+SUMMARY_BATCH_MIN = 8
+
+# whether a user has any transactions at all, a primary key lookup on user_summary
+SUMMARY_KNOWN_USER = "SELECT 1 FROM user_summary WHERE user_id = ?;"
+
+# how many recent /summary results are kept in memory
+SUMMARY_CACHE_SIZE = 4096
+
+# most users a single batched /summary query will look up
+SUMMARY_BATCH_MAX = 256
+
+# worker threads answering /summary lookups, each with its own cursor. more workers than
+# cores only splits batches up and fights over the CPU (on one core, 4 workers served
+# ~310 req/s at 32 concurrent clients against ~1100 req/s with 1), so follow the core count
+SUMMARY_WORKERS = min(4, os.cpu_count() or 1)
+
+# shared parent connection, opened on first use and reused for the life of the process
+_DB = None
+_DB_LOCK = threading.Lock()
+
+def _get_db():
+    """ Opens the shared DuckDB connection the first time it's needed and makes sure the
+    transactions table, its index and the user_summary rollup exist.
+    After that the same connection is returned every time"""
+    global _DB
+    if _DB is None:
+        with _DB_LOCK:
+            if _DB is None:
+                db = duckdb.connect(DB_PATH)
+                # fixed-width columns first, the variable-width transaction_id (never read by
+                # /summary) goes last. inserts name their columns so older files with
+                # transaction_id first still work
+                db.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS transactions (
+                        user_id INTEGER,
+                        product_id INTEGER,
+                        timestamp TIMESTAMP,
+                        transaction_amount DOUBLE,
+                        transaction_id VARCHAR
+                    );
+                    """
+                )
+                # index on user_id so /summary looks up a user's rows instead of scanning the table
+                db.execute("CREATE INDEX IF NOT EXISTS idx_tx_user ON transactions(user_id);")
+                # per-user running totals so an unfiltered /summary is a single row lookup,
+                # backfilled from transactions the first time the table is created.
+                # create + backfill is one transaction so a failed backfill can't leave
+                # an empty rollup behind that later opens would take as complete
+                has_rollup = db.execute(
+                    "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = 'user_summary';"
+                ).fetchone()[0]
+                if not has_rollup:
+                    try:
+                        db.execute(
+                            f"""
+                            BEGIN;
+                            CREATE TABLE user_summary (
+                                user_id INTEGER PRIMARY KEY,
+                                tx_count BIGINT,
+                                amount_count BIGINT,
+                                amount_sum DOUBLE,
+                                amount_min DOUBLE,
+                                amount_max DOUBLE
+                            );
+                            INSERT INTO user_summary {ROLLUP_SELECT.format(source='transactions')};
+                            COMMIT;
+                            """
+                        )
+                    except duckdb.Error:
+                        db.rollback()
+                        db.close()
+                        raise
+                _DB = db
+    return _DB
+
 def get_conn():
-    """ Opens a DuckDB connection and ensures the transactions table exists. 
-    If it doesnt yet exist it will create it"""
-    conn = duckdb.connect(DB_PATH)
-    conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS transactions (
-            transaction_id VARCHAR,
-            user_id INTEGER,
-            product_id INTEGER,
-            timestamp TIMESTAMP,
-            transaction_amount DOUBLE
-        );
-        """
+    """ Returns a cursor off the shared DuckDB connection for a single request.
+    Cursors are safe to use from different threads, closing one leaves the parent open"""
+    return _get_db().cursor()
+
+
+
+
+# summary batching
+
+class SummaryBatcher:
+    """
+    Coalesces concurrent /summary lookups into shared queries
+
+    Requests are queued and a small pool of worker threads (one cursor each) answers them.
+    Every time a worker picks up work it takes everything that's queued (up to
+    SUMMARY_BATCH_MAX), groups it by date filter and answers each group, so N requests that
+    arrive together can share one scan instead of doing N. A request that arrives alone is
+    answered straight away, and while one worker is busy with a slow aggregation the others
+    keep serving the rest of the queue
+    """
+
+    # queued by close(), every worker that takes it puts it back for the next one and stops
+    _CLOSE = object()
+
+    def __init__(self, max_batch=SUMMARY_BATCH_MAX, workers=SUMMARY_WORKERS):
+        self._max_batch = max_batch
+        self._queue = queue.SimpleQueue()
+        self._workers = [None] * workers
+        self._lock = threading.Lock()
+
+    def submit(self, user_id, start, end):
+        """ Queues a lookup and returns a Future that resolves to the user's
+        (count, min, max, mean) row, or None if they have no matching transactions"""
+        # (re)start any worker that isn't running, e.g. on first use
+        if not all(w is not None and w.is_alive() for w in self._workers):
+            with self._lock:
+                for i, w in enumerate(self._workers):
+                    if w is None or not w.is_alive():
+                        w = threading.Thread(target=self._run, name=f"summary-batcher-{i}", daemon=True)
+                        w.start()
+                        self._workers[i] = w
+        fut = Future()
+        self._queue.put((user_id, start, end, fut))
+        return fut
+
+    def close(self):
+        """ Stops the worker threads once they've answered everything queued before the call
+        and closes their cursors. Lookups still queued after that are cancelled, a later
+        submit starts new workers"""
+        with self._lock:
+            self._queue.put(self._CLOSE)
+            for w in self._workers:
+                if w is not None:
+                    w.join()
+            self._workers = [None] * len(self._workers)
+            # the last worker put the marker back, clear it and anything queued behind it
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not self._CLOSE:
+                    item[-1].cancel()
+
+    def _run(self):
+        conn = None
+        try:
+            while True:
+                # block for the first request, then drain whatever else is already waiting
+                pending = [self._queue.get()]
+                while len(pending) < self._max_batch and pending[-1] is not self._CLOSE:
+                    try:
+                        pending.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                closing = pending[-1] is self._CLOSE
+                if closing:
+                    pending.pop()
+
+                # lookups whose request was cancelled while queued (a timeout, the client
+                # going away, shutdown) are dropped. the rest are marked running, so they
+                # can't be cancelled from under the worker any more and are safe to resolve
+                pending = [item for item in pending if item[-1].set_running_or_notify_cancel()]
+                if pending:
+                    conn = self._dispatch(conn, pending)
+
+                if closing:
+                    self._queue.put(self._CLOSE)
+                    return
+        finally:
+            try:
+                if conn is not None:
+                    conn.close()
+            except Exception:
+                pass
+
+    def _dispatch(self, conn, pending):
+        """ Answers one drained batch of lookups, returns the worker's cursor"""
+        # the cursor is taken here rather than up front so a database that can't be
+        # opened fails the waiting requests (and is retried next time) instead of
+        # killing the worker and leaving them waiting forever
+        if conn is None:
+            try:
+                conn = get_conn()
+            except Exception as e:
+                for *_, fut in pending:
+                    fut.set_exception(e)
+                return None
+
+        groups = {}
+        for user_id, start, end, fut in pending:
+            groups.setdefault((start, end), []).append((user_id, fut))
+        for (start, end), waiters in groups.items():
+            try:
+                self._answer(conn, start, end, waiters)
+            except Exception as e:
+                # whatever goes wrong the worker keeps running and no waiter is left hanging
+                for _, fut in waiters:
+                    if not fut.done():
+                        fut.set_exception(e)
+        return conn
+
+    def _answer(self, conn, start, end, waiters):
+        user_ids = list({user_id for user_id, _ in waiters})
+        try:
+            key = (start is not None, end is not None)
+            dates = [d for d in (start, end) if d]
+            rows = {}
+            if len(user_ids) < SUMMARY_BATCH_MIN:
+                for user_id in user_ids:
+                    # with a date filter, users the rollup has never seen get their 404 from
+                    # a primary key lookup on user_summary instead of an aggregation
+                    if dates and conn.execute(SUMMARY_KNOWN_USER, [user_id]).fetchone() is None:
+                        continue
+                    row = conn.execute(SUMMARY_QUERIES[key], [user_id, *dates]).fetchone()
+                    # the rollup has no row for unknown users, the aggregate returns a count of 0
+                    if row is not None and row[0]:
+                        rows[user_id] = row
+            else:
+                # a batch is one scan either way, users without rows just don't come back
+                query = SUMMARY_BATCH_QUERIES[key]
+                rows = {row[0]: row[1:] for row in conn.execute(query, [user_ids, *dates]).fetchall()}
+        except Exception as e:
+            for _, fut in waiters:
+                fut.set_exception(e)
+            return
+        for user_id, fut in waiters:
+            fut.set_result(rows.get(user_id))
+
+
+_SUMMARY_BATCHER = SummaryBatcher()
+
+
+
+
+# summary caching
+
+class SummaryCache:
+    """
+    Small LRU of recent /summary results, keyed by (epoch, user_id, start, end)
+
+    Results only change when an upload lands, so every successful upload bumps the epoch
+    and clears the entries. A lookup that started before an upload was stored under the
+    old epoch, so it can't be served afterwards
+    """
+
+    MISSING = object()
+
+    def __init__(self, max_size=SUMMARY_CACHE_SIZE):
+        self._max_size = max_size
+        self._entries = OrderedDict()
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def key(self, user_id, start, end):
+        """ Cache key for a lookup made now, take it before querying"""
+        return (self._epoch, user_id, start, end)
+
+    def get(self, key):
+        """ Returns the cached row (None is a cached 404), or SummaryCache.MISSING"""
+        with self._lock:
+            if key not in self._entries:
+                return self.MISSING
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, row):
+        with self._lock:
+            if key[0] != self._epoch:
+                return
+            self._entries[key] = row
+            self._entries.move_to_end(key)
+            if len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+
+
+_SUMMARY_CACHE = SummaryCache()
+
+
+
+
+# ingestion
+
+# uploads run in worker threads, this makes them write one at a time so concurrent
+# uploads for the same users don't conflict when merging into user_summary
+_INGEST_LOCK = threading.Lock()
+
+def _parse_csv(source):
+    """ Parses only the required columns of an uploaded CSV file object into an Arrow table
+    with their known types, extra columns are skipped without being parsed or type sniffed"""
+    # uploads under Starlette's spool size are still a BytesIO in memory (Starlette checks
+    # _rolled the same way). hand Arrow those bytes directly, getvalue() shares them rather
+    # than copying, instead of reading them back through the file object.
+    # _file is a SpooledTemporaryFile internal Starlette doesn't use, so if it's missing or
+    # isn't a BytesIO the upload is read through the file object like one on disk
+    buffer = getattr(source, "_file", None)
+    if not getattr(source, "_rolled", True) and isinstance(buffer, io.BytesIO):
+        data = buffer.getvalue()
+        def open_source():
+            return pa.BufferReader(data)
+    else:
+        def open_source():
+            source.seek(0)
+            return source
+
+    try:
+        return _read_csv(open_source(), CSV_COLUMN_TYPES)
+    except pa.ArrowInvalid as e:
+        # timestamps with a zone offset (e.g. Z or +02:00) don't parse as a plain timestamp,
+        # only then is the file read again with that column as text. the INSERT casts it to
+        # TIMESTAMP, which converts offsets to UTC. any other bad value is a 400 straight away
+        if "expected no zone offset" not in str(e):
+            raise HTTPException(status_code=400, detail=f"Invalid data format: {e}")
+    try:
+        return _read_csv(open_source(), {**CSV_COLUMN_TYPES, "timestamp": pa.string()})
+    except pa.ArrowInvalid as e:
+        raise HTTPException(status_code=400, detail=f"Invalid data format: {e}")
+
+def _read_csv(source, column_types):
+    # only empty fields are NULL, in every column including transaction_id. Arrow's other
+    # default null markers (NA, NULL, N/A, ...) are rejected as invalid values like any other
+    # bad data. "nan" isn't one of them, it parses as a NaN amount
+    return pacsv.read_csv(
+        source,
+        read_options=pacsv.ReadOptions(block_size=CSV_BLOCK_SIZE),
+        convert_options=pacsv.ConvertOptions(
+            column_types=column_types,
+            include_columns=list(column_types),
+            null_values=[""],
+            strings_can_be_null=True,
+        ),
     )
-    return conn
+
+def _ingest(tbl):
+    """ Inserts a parsed upload into the transactions table and merges it into the
+    user_summary rollup, returns the number of rows inserted"""
+    conn = None
+    try:
+        conn = get_conn()
+
+        # expose the Arrow table to DuckDB as a view, DuckDB scans it without copying
+        conn.register("tmp_csv", tbl)
+
+        # insert rows into transactions table and merge the user_summary rollup
+        # in one transaction, sent as a single execute, so the two never disagree
+        # and a failed upload leaves nothing behind
+        with _INGEST_LOCK:
+            try:
+                conn.execute(INGEST_SQL)
+            except duckdb.Error as e:
+                try:
+                    conn.rollback()
+                except duckdb.Error:
+                    pass
+                raise HTTPException(status_code=400, detail=f"Ingestion error: {e}")
+
+            # cached summaries are stale now
+            _SUMMARY_CACHE.invalidate()
+
+        # every parsed row is inserted, so the count comes from the Arrow table
+        return tbl.num_rows
+
+    finally:
+        # clean up cursor
+        try:
+            if conn is not None:
+                conn.close()
+        except Exception:
+            pass
 
 
 
 
 # FastAPI app
 
+@asynccontextmanager
+async def lifespan(app):
+    """ The shared connection stays open for the life of the process, so on shutdown
+    stop the summary workers, write everything in the WAL back into the database file
+    and close the connection"""
+    global _DB
+    yield
+    await anyio.to_thread.run_sync(_SUMMARY_BATCHER.close)
+    with _DB_LOCK:
+        if _DB is not None:
+            try:
+                _DB.execute("CHECKPOINT;")
+            finally:
+                _DB.close()
+                _DB = None
+
 app = FastAPI(
     title="Transactions Summary API",
     description="Upload CSV of transactions and query per-user summary stats over a date range.",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
 
@@ -61,7 +535,7 @@ app = FastAPI(
 
 class SummaryResponse(BaseModel):
     """
-    Response that's returned by the /summary endpoint
+    Shape of the response returned by the /summary endpoint (used for the API docs)
 
     Gives back basic stats for a user's transactions over an optional time window including: 
     how many transactions, min, max, and average amount
@@ -96,71 +570,31 @@ async def upload_csv(file: UploadFile = File(...)):
     if not file.filename.lower().endswith(".csv"):
         raise HTTPException(status_code=400, detail="Only CSV files are accepted.")
 
-    # save upload to temp file
+    # read just the header line, the rest of the upload stays in the spooled file
+    # the CSV reader parses it from
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".csv") as tmp:
-            tmp.write(await file.read())
-            tmp_path = tmp.name
+        await file.seek(0)
+        header = file.file.readline()
+        await file.seek(0)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to save uploaded file: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to read uploaded file: {e}")
 
-    conn = None
-    try:
-        conn = get_conn()
-
-        # load CSV into temp view
-        safe_path = tmp_path.replace("'", "''")
-        conn.execute(
-            f"""
-            CREATE TEMP VIEW tmp_csv AS
-            SELECT * FROM read_csv_auto('{safe_path}', HEADER=TRUE, SAMPLE_SIZE=-1);
-            """
-        )
+    # check the CSV header has all required columns before parsing anything,
+    # header names can be quoted and the file can start with a UTF-8 BOM
+    header_line = header.decode("utf-8-sig", errors="replace").rstrip("\r\n")
+    cols = set(next(csv.reader([header_line]), []))
+    if missing := (CSV_COLUMN_TYPES.keys() - cols):
+        raise HTTPException(status_code=400, detail=f"Missing columns: {', '.join(sorted(missing))}")
 
-        # check the CSV has all required columns before inserting
-        required = {"transaction_id", "user_id", "product_id", "timestamp", "transaction_amount"}
-        cols = {row[0] for row in conn.execute("DESCRIBE tmp_csv").fetchall()}
-        if missing := (required - cols):
-            raise HTTPException(status_code=400, detail=f"Missing columns: {', '.join(sorted(missing))}")
+    # parse and load off the event loop so other requests keep being served meanwhile
+    tbl = await anyio.to_thread.run_sync(_parse_csv, file.file)
+    rows_inserted = await anyio.to_thread.run_sync(_ingest, tbl)
+    return ORJSONResponse({"status": "ok", "rows_inserted": rows_inserted})
 
-        # insert rows into transactions table with explicit type casting
-        try:
-            inserted = conn.execute(
-                """
-                INSERT INTO transactions
-                SELECT
-                    CAST(transaction_id AS VARCHAR),
-                    CAST(user_id AS INTEGER),
-                    CAST(product_id AS INTEGER),
-                    CAST(timestamp AS TIMESTAMP),
-                    CAST(transaction_amount AS DOUBLE)
-                FROM tmp_csv
-                RETURNING 1;
-                """
-            ).fetchall()
-        except duckdb.ConversionException as e:
-            raise HTTPException(status_code=400, detail=f"Invalid data format: {e}")
-        except duckdb.Error as e:
-            raise HTTPException(status_code=400, detail=f"Ingestion error: {e}")
 
-        return JSONResponse({"status": "ok", "rows_inserted": len(inserted)})
 
-    finally:
-        # clean up connection + temp file
-        try:
-            if conn is not None:
-                conn.close()
-        except Exception:
-            pass
-        try:
-            os.remove(tmp_path)
-        except Exception:
-            pass
-
-
-
-@app.get("/summary/{user_id}", response_model=SummaryResponse)
-def summary_user(
+@app.get("/summary/{user_id}", responses={200: {"model": SummaryResponse}})
+async def summary_user(
     user_id: int,
     start: Optional[date] = Query(default=None, description="Start date (inclusive, YYYY-MM-DD)"),
     end: Optional[date] = Query(default=None, description="End date (inclusive, YYYY-MM-DD)"),
@@ -178,43 +612,29 @@ def summary_user(
     if start and end and end < start:
         raise HTTPException(status_code=400, detail="end date must be on/after start date.")
 
-    conn = None
-    try:
-        conn = get_conn()
-
-        # build WHERE clause dynamically based on filters
-        conditions, params = ["user_id = ?"], [user_id]
-        if start:
-            conditions.append("timestamp >= ?")
-            params.append(datetime.combine(start, datetime.min.time()))
-        if end:
-            end_next = datetime.combine(end, datetime.min.time()) + timedelta(days=1)
-            conditions.append("timestamp < ?")
-            params.append(end_next)
-
-        query = f"""
-            SELECT COUNT(*) AS count,
-                MIN(transaction_amount) AS min,
-                MAX(transaction_amount) AS max,
-                AVG(transaction_amount) AS mean
-            FROM transactions
-            WHERE {' AND '.join(conditions)};
-        """
-
-        # run query, return 404 if no transactions found
-        count, min_v, max_v, mean_v = conn.execute(query, params).fetchone()
-        if count == 0:
-            raise HTTPException(status_code=404, detail="No transactions found for the given criteria.")
-
-        return SummaryResponse(
-            user_id=user_id,
-            start_date=start,
-            end_date=end,
-            count=count,
-            min=min_v,
-            max=max_v,
-            mean=mean_v,
-        )
-    finally:
-        if conn is not None:
-            conn.close()
\ No newline at end of file
+    # user_id column is a 32-bit INTEGER, anything outside that range can't have transactions
+    if not -2**31 <= user_id < 2**31:
+        raise HTTPException(status_code=404, detail="No transactions found for the given criteria.")
+
+    # serve from the cache if nothing was uploaded since this lookup was last made,
+    # otherwise hand it to the batcher, which may answer it together with other requests,
+    # and wait for it without tying up a thread. return 404 if no transactions found
+    cache_key = _SUMMARY_CACHE.key(user_id, start, end)
+    row = _SUMMARY_CACHE.get(cache_key)
+    if row is SummaryCache.MISSING:
+        row = await asyncio.wrap_future(_SUMMARY_BATCHER.submit(user_id, start, end))
+        _SUMMARY_CACHE.put(cache_key, row)
+    if row is None:
+        raise HTTPException(status_code=404, detail="No transactions found for the given criteria.")
+    count, min_v, max_v, mean_v = row
+
+    # build the response by hand rather than through SummaryResponse, which is only used for the docs
+    return ORJSONResponse({
+        "user_id": user_id,
+        "start_date": start.isoformat() if start else None,
+        "end_date": end.isoformat() if end else None,
+        "count": count,
+        "min": min_v,
+        "max": max_v,
+        "mean": mean_v,
+    })
@@ -1,8 +1,13 @@
 import io
 import csv
 import os
+import threading
+import pytest
+from datetime import date
 from fastapi.testclient import TestClient
-from app.main import app, DB_PATH
+from app.main import (
+    app, DB_PATH, SUMMARY_KNOWN_USER, SUMMARY_QUERIES, SummaryBatcher, _parse_csv, get_conn,
+)
 
 client = TestClient(app)
 
@@ -12,9 +17,23 @@ client = TestClient(app)
 # helpers
 
 def setup_module(module):
-    # reset the DB before tests run
-    if os.path.exists(DB_PATH):
-        os.remove(DB_PATH)
+    # reset the DB (and any WAL a killed run left next to it) before tests run
+    for path in (DB_PATH, DB_PATH + ".wal"):
+        if os.path.exists(path):
+            os.remove(path)
+    # run the app's startup now and its shutdown in teardown_module, which checkpoints
+    # the WAL into the database file and closes it
+    client.__enter__()
+
+def teardown_module(module):
+    client.__exit__(None, None, None)
+
+@pytest.fixture
+def batcher():
+    # a batcher of the test's own, its workers are stopped and their cursors closed afterwards
+    b = SummaryBatcher()
+    yield b
+    b.close()
 
 def make_csv(rows):
     # build a CSV string from a list of dict rows
@@ -232,4 +251,265 @@ def test_summary_handles_null_amounts():
 def test_summary_validation_errors_from_fastapi():
     # FastAPI should return 422 for invalid path/query params
     assert client.get("/summary/not-an-int").status_code == 422
-    assert client.get("/summary/1?start=2024-13-99&end=nope").status_code == 422
\ No newline at end of file
+    assert client.get("/summary/1?start=2024-13-99&end=nope").status_code == 422
+
+def test_upload_accepts_bom_and_quoted_header():
+    # header with a UTF-8 BOM and quoted column names should still pass the column check
+    data = (
+        '\ufeff"transaction_id","user_id","product_id","timestamp","transaction_amount"\r\n'
+        'q110a,110,1,2024-11-01 12:00:00,12.5\r\n'
+    ).encode("utf-8")
+    r = client.post("/upload", files={"file": ("bom_110.csv", data, "text/csv")})
+    assert r.status_code == 200
+    assert r.json()["rows_inserted"] == 1
+
+    r2 = client.get("/summary/110")
+    assert r2.status_code == 200
+    assert r2.json()["count"] == 1
+
+
+def test_summary_merges_totals_across_uploads():
+    # a second upload for the same user should be merged into the unfiltered summary
+    first = [
+        {"transaction_id":"m120a","user_id":120,"product_id":1,"timestamp":"2024-12-01 10:00:00","transaction_amount":20.0},
+        {"transaction_id":"m120b","user_id":120,"product_id":1,"timestamp":"2024-12-02 10:00:00","transaction_amount":""},
+    ]
+    second = [
+        {"transaction_id":"m120c","user_id":120,"product_id":1,"timestamp":"2024-12-03 10:00:00","transaction_amount":5.0},
+        {"transaction_id":"m120d","user_id":120,"product_id":1,"timestamp":"2024-12-04 10:00:00","transaction_amount":80.0},
+    ]
+    for i, rows in enumerate([first, second]):
+        data = make_csv(rows).read().encode()
+        r = client.post("/upload", files={"file": (f"merge_120_{i}.csv", data, "text/csv")})
+        assert r.status_code == 200
+
+    r2 = client.get("/summary/120")
+    assert r2.status_code == 200
+    body = r2.json()
+    # NULL amount counts as a row but is left out of min/max/mean, same as the filtered path
+    assert body["count"] == 4
+    assert body["min"] == 5.0
+    assert body["max"] == 80.0
+    assert round(body["mean"], 2) == 35.0
+
+    r3 = client.get("/summary/120?start=2024-12-01&end=2024-12-04")
+    assert r3.json() == {**body, "start_date": "2024-12-01", "end_date": "2024-12-04"}
+
+
+def test_summary_batcher_answers_each_request(batcher):
+    # lookups queued together are answered per user and per date filter, unknown users get None
+    futs = [
+        batcher.submit(1, None, None),
+        batcher.submit(2, None, None),
+        batcher.submit(1, date(2024, 1, 2), date(2024, 1, 2)),
+        batcher.submit(999, None, None),
+        batcher.submit(1, None, None),
+    ]
+    results = [f.result(timeout=5) for f in futs]
+    assert results[0] == (2, 50.5, 100.0, 75.25)
+    assert results[1] == (1, 75.0, 75.0, 75.0)
+    assert results[2] == (1, 50.5, 50.5, 50.5)
+    assert results[3] is None
+    assert results[4] == results[0]
+
+
+def test_summary_unknown_user_with_date_filter():
+    # a user with no transactions at all should 404 with date filters too
+    r = client.get("/summary/998?start=2024-01-01&end=2024-12-31")
+    assert r.status_code == 404
+    assert "No transactions found" in r.text
+
+
+def test_summary_reflects_new_upload_after_cached_lookup():
+    # a summary that was already looked up should change once more rows are uploaded
+    rows = [
+        {"transaction_id":"c130a","user_id":130,"product_id":1,"timestamp":"2024-09-01 10:00:00","transaction_amount":10.0},
+    ]
+    r = client.post("/upload", files={"file": ("cache_130a.csv", make_csv(rows).read().encode(), "text/csv")})
+    assert r.status_code == 200
+    assert client.get("/summary/130").json()["count"] == 1
+    assert client.get("/summary/131").status_code == 404
+
+    rows = [
+        {"transaction_id":"c130b","user_id":130,"product_id":1,"timestamp":"2024-09-02 10:00:00","transaction_amount":30.0},
+        {"transaction_id":"c131a","user_id":131,"product_id":1,"timestamp":"2024-09-02 10:00:00","transaction_amount":5.0},
+    ]
+    r = client.post("/upload", files={"file": ("cache_130b.csv", make_csv(rows).read().encode(), "text/csv")})
+    assert r.status_code == 200
+
+    body = client.get("/summary/130").json()
+    assert body["count"] == 2
+    assert body["mean"] == 20.0
+    assert client.get("/summary/131").status_code == 200
+
+
+def test_upload_accepts_empty_user_id_and_leaves_it_out_of_summaries():
+    # a row with an empty user_id is stored but doesn't count towards any user's summary
+    rows = [
+        {"transaction_id":"u140a","user_id":"","product_id":1,"timestamp":"2024-03-01 10:00:00","transaction_amount":99.0},
+        {"transaction_id":"u140b","user_id":140,"product_id":1,"timestamp":"2024-03-01 11:00:00","transaction_amount":1.0},
+    ]
+    data = make_csv(rows).read().encode()
+    r = client.post("/upload", files={"file": ("null_user_140.csv", data, "text/csv")})
+    assert r.status_code == 200
+    assert r.json()["rows_inserted"] == 2
+
+    r2 = client.get("/summary/140")
+    assert r2.status_code == 200
+    body = r2.json()
+    assert body["count"] == 1
+    assert body["min"] == body["max"] == body["mean"] == 1.0
+
+
+def test_single_user_summary_queries_use_the_index():
+    # the per-user queries must stay in the user_id = ? form DuckDB answers from the
+    # index / primary key, other forms (IN, ANY, list_contains) fall back to a full scan
+    conn = get_conn()
+    try:
+        checks = [(SUMMARY_KNOWN_USER, [1])]
+        for (has_start, has_end), query in SUMMARY_QUERIES.items():
+            checks.append((query, [1] + [date(2024, 1, 1)] * (has_start + has_end)))
+        for query, params in checks:
+            plan = conn.execute(f"EXPLAIN {query}", params).fetchall()[0][1]
+            assert "INDEX_SCAN" in plan and "SEQ_SCAN" not in plan, query
+    finally:
+        conn.close()
+
+
+def test_summary_batcher_answers_batched_groups(batcher, monkeypatch):
+    # with the threshold at 1 every group goes through the batched queries
+    monkeypatch.setattr("app.main.SUMMARY_BATCH_MIN", 1)
+    for start, end in [(None, None), (date(2024, 1, 2), date(2024, 1, 2))]:
+        futs = {u: batcher.submit(u, start, end) for u in [1, 2, 999]}
+        results = {u: f.result(timeout=5) for u, f in futs.items()}
+        if start is None:
+            assert results[1] == (2, 50.5, 100.0, 75.25)
+            assert results[2] == (1, 75.0, 75.0, 75.0)
+        else:
+            assert results[1] == (1, 50.5, 50.5, 50.5)
+            assert results[2] is None
+        assert results[999] is None
+
+
+def test_summary_batcher_fails_requests_when_database_cant_open(batcher, monkeypatch):
+    # a cursor that can't be opened should fail the waiting lookups, not hang them,
+    # and the batcher should work again once the database is reachable
+    def broken_conn():
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr("app.main.get_conn", broken_conn)
+    with pytest.raises(RuntimeError, match="database unavailable"):
+        batcher.submit(1, None, None).result(timeout=5)
+
+    monkeypatch.undo()
+    assert batcher.submit(1, None, None).result(timeout=5) == (2, 50.5, 100.0, 75.25)
+
+
+def test_summary_batcher_restarts_after_close(batcher):
+    # once the workers have been stopped, the next submit should start new ones
+    assert batcher.submit(2, None, None).result(timeout=5) == (1, 75.0, 75.0, 75.0)
+    batcher.close()
+    assert batcher.submit(2, None, None).result(timeout=5) == (1, 75.0, 75.0, 75.0)
+
+
+def test_summary_batcher_survives_cancelled_requests(monkeypatch):
+    # a request cancelled while its lookup is queued (timeout, client gone) is dropped,
+    # the worker keeps running and the lookups queued with it are still answered
+    entered, release = threading.Event(), threading.Event()
+
+    def slow_conn():
+        entered.set()
+        release.wait(5)
+        return get_conn()
+
+    monkeypatch.setattr("app.main.get_conn", slow_conn)
+    # one worker, so the lookups below queue up behind the first one
+    batcher = SummaryBatcher(workers=1)
+    try:
+        first = batcher.submit(1, None, None)
+        assert entered.wait(5)
+        cancelled = batcher.submit(2, None, None)
+        rest = batcher.submit(1, date(2024, 1, 2), date(2024, 1, 2))
+        assert cancelled.cancel()
+        # the first lookup is already being answered, so it can't be cancelled any more
+        assert not first.cancel()
+        release.set()
+
+        assert first.result(timeout=5) == (2, 50.5, 100.0, 75.25)
+        assert rest.result(timeout=5) == (1, 50.5, 50.5, 50.5)
+        assert batcher.submit(2, None, None).result(timeout=5) == (1, 75.0, 75.0, 75.0)
+    finally:
+        release.set()
+        batcher.close()
+
+
+def test_upload_normalizes_timestamps_with_zone_offsets_to_utc():
+    # Z and +HH:MM offsets are accepted and stored as UTC, mixed with plain timestamps
+    rows = [
+        {"transaction_id":"z150a","user_id":150,"product_id":1,"timestamp":"2024-04-01T23:30:00Z","transaction_amount":10.0},
+        {"transaction_id":"z150b","user_id":150,"product_id":1,"timestamp":"2024-04-02 01:00:00+02:00","transaction_amount":20.0},
+        {"transaction_id":"z150c","user_id":150,"product_id":1,"timestamp":"2024-04-02 12:00:00","transaction_amount":40.0},
+    ]
+    data = make_csv(rows).read().encode()
+    r = client.post("/upload", files={"file": ("offsets_150.csv", data, "text/csv")})
+    assert r.status_code == 200
+    assert r.json()["rows_inserted"] == 3
+
+    # 01:00+02:00 on the 2nd is 23:00 UTC on the 1st
+    r2 = client.get("/summary/150?start=2024-04-01&end=2024-04-01")
+    assert r2.status_code == 200
+    body = r2.json()
+    assert body["count"] == 2
+    assert body["min"] == 10.0
+    assert body["max"] == 20.0
+
+
+def test_upload_rejects_null_markers_and_fractional_ids():
+    # only empty fields become NULL, text like NA/NULL/N/A is invalid data -> 400
+    for amount in ["NA", "NULL", "N/A", "null", "#N/A"]:
+        rows = [
+            {"transaction_id":"nm160","user_id":160,"product_id":1,"timestamp":"2024-05-01 12:00:00","transaction_amount":amount},
+        ]
+        data = make_csv(rows).read().encode()
+        r = client.post("/upload", files={"file": ("null_marker_160.csv", data, "text/csv")})
+        assert r.status_code == 400, amount
+
+    # integer columns must be written as integers
+    rows = [
+        {"transaction_id":"f161","user_id":"161.0","product_id":1,"timestamp":"2024-05-01 12:00:00","transaction_amount":1.0},
+    ]
+    data = make_csv(rows).read().encode()
+    r = client.post("/upload", files={"file": ("fractional_id_161.csv", data, "text/csv")})
+    assert r.status_code == 400
+    assert client.get("/summary/160").status_code == 404
+
+
+def test_upload_stores_empty_transaction_id_as_null():
+    # an empty transaction_id is NULL like any other empty field, not an empty string
+    rows = [
+        {"transaction_id":"","user_id":170,"product_id":1,"timestamp":"2024-05-03 12:00:00","transaction_amount":3.0},
+    ]
+    data = make_csv(rows).read().encode()
+    r = client.post("/upload", files={"file": ("empty_tx_id_170.csv", data, "text/csv")})
+    assert r.status_code == 200
+
+    conn = get_conn()
+    try:
+        ids = conn.execute("SELECT transaction_id FROM transactions WHERE user_id = 170;").fetchall()
+    finally:
+        conn.close()
+    assert ids == [(None,)]
+
+
+def test_parse_csv_reads_in_memory_uploads_without_the_spooled_buffer():
+    # an in-memory upload whose internal _file isn't a BytesIO is read through the file object
+    class InMemoryUpload(io.BytesIO):
+        _rolled = False
+        _file = None
+
+    rows = [
+        {"transaction_id":"p1","user_id":1,"product_id":1,"timestamp":"2024-05-04 12:00:00","transaction_amount":2.0},
+    ]
+    tbl = _parse_csv(InMemoryUpload(make_csv(rows).read().encode()))
+    assert tbl.num_rows == 1
+    assert tbl["transaction_id"].to_pylist() == ["p1"]